@@ -5,22 +5,28 @@ Local monitoring dashboard for NPK sensor data
 """
 
 import streamlit as st
-import yaml
-import time
+from streamlit_autorefresh import st_autorefresh
 import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
+import plotly.io as pio
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from collections import deque
+from datetime import datetime
 from pathlib import Path
 import sys
+import urllib.request
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 
+from analytics import lttb_indices, rolling_stats
+from config_loader import load_config_fast
 from npk_reader import NPKSensorReader
 from mqtt_publisher import ThingsBoardMQTTPublisher
 
+# Serialize figures with orjson (C encoder with a NumPy fast path)
+pio.json.config.default_engine = 'orjson'
+
 # Page configuration
 st.set_page_config(
     page_title="NPK Sensor Monitor",
@@ -57,6 +63,24 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Number of readings kept in the session history
+HISTORY_SIZE = 1440
+HISTORY_COLUMNS = ['timestamp', 'nitrogen', 'phosphorus', 'potassium']
+HISTORY_DTYPES = {'nitrogen': 'float32', 'phosphorus': 'float32', 'potassium': 'float32'}
+
+# Status labels indexed by connection state
+STATUS_LABELS = ("🔴 Disconnected", "🟢 Connected")
+
+# Sidebar logo
+LOGO_URL = "https://via.placeholder.com/300x100/2E7D32/FFFFFF?text=NPK+Monitor"
+
+# Maximum points per history trace sent to the browser
+MAX_CHART_POINTS = 1000
+
+# Seconds between background sensor reads, shared by all sessions
+# (the shortest refresh interval a session can pick)
+SENSOR_POLL_INTERVAL = 5
+
 # Load configuration
 @st.cache_resource
 def load_config():
@@ -65,8 +89,7 @@ def load_config():
     if not config_path.exists():
         config_path = Path('/etc/npk-monitor/config.yaml')
     
-    with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
+    return load_config_fast(config_path)
 
 # Initialize sensor
 @st.cache_resource
@@ -81,6 +104,8 @@ def init_sensor(config):
             timeout=sensor_config.get('timeout', 1.0),
             registers=sensor_config.get('registers')
         )
+        # Keep RS-485 reads off the script runner, reruns pick up the latest sample
+        sensor.start_polling(SENSOR_POLL_INTERVAL)
         return sensor
     except Exception as e:
         st.error(f"Failed to initialize sensor: {e}")
@@ -99,18 +124,34 @@ def init_publisher(config):
             port=mqtt_config.get('port', 1883),
             access_token=tb_config['access_token'],
             keepalive=mqtt_config.get('keepalive', 60),
-            qos=mqtt_config.get('qos', 1)
+            qos=mqtt_config.get('qos', 1),
+            protocol=mqtt_config.get('protocol', '3.1.1')
         )
         return publisher
     except Exception as e:
         st.error(f"Failed to initialize publisher: {e}")
         return None
 
-def create_gauge_chart(value, title, max_value=200, color='green'):
-    """Create a gauge chart for NPK values"""
+@st.cache_data(ttl=86400)
+def _logo_bytes():
+    """Download the sidebar logo once a day (None if unavailable)"""
+    try:
+        with urllib.request.urlopen(LOGO_URL, timeout=5) as response:
+            return response.read()
+    except Exception:
+        return None
+
+@st.cache_data(ttl=10)
+def _mqtt_status_cached(_publisher):
+    """Return the publisher connection state, refreshed at most every 10 seconds"""
+    return _publisher.is_connected()
+
+@st.cache_resource
+def _build_gauge_shell(title, max_value=200, color='green'):
+    """Build the static parts of a gauge chart once per title/max/color"""
     fig = go.Figure(go.Indicator(
         mode="gauge+number+delta",
-        value=value,
+        value=0,
         title={'text': title, 'font': {'size': 20}},
         delta={'reference': max_value * 0.5},
         gauge={
@@ -132,8 +173,21 @@ def create_gauge_chart(value, title, max_value=200, color='green'):
     fig.update_layout(height=250, margin=dict(l=20, r=20, t=50, b=20))
     return fig
 
-def create_history_chart(df):
-    """Create time series chart for sensor history"""
+def update_gauge(fig, value):
+    """Update the value shown by a gauge chart"""
+    fig.update_traces(value=value, selector=dict(type='indicator'))
+    return fig
+
+def create_gauge_chart(value, title, max_value=200, color='green'):
+    """Create a gauge chart for NPK values"""
+    # The cached shell is shared by all sessions, update a copy of it
+    return update_gauge(go.Figure(_build_gauge_shell(title, max_value, color)), value)
+
+@st.cache_resource
+def _build_history_shell():
+    """Build the 3-row history chart layout once"""
+    from plotly.subplots import make_subplots
+    
     fig = make_subplots(
         rows=3, cols=1,
         subplot_titles=('Nitrogen (N)', 'Phosphorus (P)', 'Potassium (K)'),
@@ -141,19 +195,19 @@ def create_history_chart(df):
     )
     
     fig.add_trace(
-        go.Scatter(x=df['timestamp'], y=df['nitrogen'], name='N', 
+        go.Scatter(x=[], y=[], name='N',
                   line=dict(color='#1f77b4', width=2)),
         row=1, col=1
     )
     
     fig.add_trace(
-        go.Scatter(x=df['timestamp'], y=df['phosphorus'], name='P',
+        go.Scatter(x=[], y=[], name='P',
                   line=dict(color='#ff7f0e', width=2)),
         row=2, col=1
     )
     
     fig.add_trace(
-        go.Scatter(x=df['timestamp'], y=df['potassium'], name='K',
+        go.Scatter(x=[], y=[], name='K',
                   line=dict(color='#2ca02c', width=2)),
         row=3, col=1
     )
@@ -166,9 +220,39 @@ def create_history_chart(df):
     fig.update_layout(height=600, showlegend=False)
     return fig
 
+def update_history_chart(fig, df):
+    """Replace the data of a history chart with the given history"""
+    # Contiguous float32 arrays let orjson encode each trace in one pass
+    timestamps = df['timestamp'].to_numpy()
+    x = timestamps.astype(np.int64).astype(np.float64)
+    
+    for name, column in (('N', 'nitrogen'), ('P', 'phosphorus'), ('K', 'potassium')):
+        y = df[column].to_numpy(dtype=np.float32)
+        if len(y) > MAX_CHART_POINTS:
+            # Downsample so the payload stays bounded however long the history gets
+            idx = lttb_indices(x, y, MAX_CHART_POINTS)
+            fig.update_traces(x=timestamps[idx], y=y[idx], selector=dict(name=name))
+        else:
+            fig.update_traces(x=timestamps, y=y, selector=dict(name=name))
+    return fig
+
+def create_history_chart(df):
+    """Create time series chart for sensor history"""
+    # The cached shell is shared by all sessions, update a copy of it
+    return update_history_chart(go.Figure(_build_history_shell()), df)
+
+def show_session_stats(values):
+    """Show session statistics for one nutrient below its gauge"""
+    mean, low, high, std = rolling_stats(np.asarray(values, dtype=np.float32))
+    st.caption(f"Session avg {mean:.1f} · min {low:.0f} · max {high:.0f} · σ {std:.1f}")
+
 def main():
     """Main dashboard"""
     
+    # Rolling history of readings for this session
+    if 'history' not in st.session_state:
+        st.session_state['history'] = deque(maxlen=HISTORY_SIZE)
+    
     # Header
     st.markdown('<p class="main-header">🌱 NPK Sensor Monitor Dashboard</p>', unsafe_allow_html=True)
     
@@ -181,12 +265,14 @@ def main():
     
     # Sidebar
     with st.sidebar:
-        st.image("https://via.placeholder.com/300x100/2E7D32/FFFFFF?text=NPK+Monitor", use_container_width=True)
+        logo = _logo_bytes()
+        if logo:
+            st.image(logo, use_container_width=True)
         st.title("Settings")
         
         # Auto-refresh
         auto_refresh = st.checkbox("Auto-refresh", value=True)
-        refresh_interval = st.slider("Refresh interval (seconds)", 5, 60, 10)
+        refresh_interval = st.slider("Refresh interval (seconds)", SENSOR_POLL_INTERVAL, 60, 10)
         
         # Sensor info
         st.subheader("Sensor Configuration")
@@ -198,6 +284,10 @@ def main():
         st.subheader("ThingsBoard")
         st.text(f"Host: {config['thingsboard']['host']}")
         
+    # Auto-refresh (browser-side timer, does not block the script runner)
+    if auto_refresh:
+        st_autorefresh(interval=refresh_interval * 1000, limit=None, key="npk_refresh")
+    
     # Initialize components
     sensor = init_sensor(config)
     publisher = init_publisher(config)
@@ -205,17 +295,14 @@ def main():
     # Status indicators
     col1, col2, col3 = st.columns(3)
     
+    sensor_ok = sensor is not None
+    mqtt_ok = publisher is not None and _mqtt_status_cached(publisher)
+    
     with col1:
-        sensor_status = "🟢 Connected" if sensor else "🔴 Disconnected"
-        st.metric("Sensor Status", sensor_status)
+        st.metric("Sensor Status", STATUS_LABELS[sensor_ok])
     
     with col2:
-        if publisher:
-            mqtt_connected = publisher.connect() if not publisher.is_connected() else publisher.is_connected()
-            mqtt_status = "🟢 Connected" if mqtt_connected else "🔴 Disconnected"
-        else:
-            mqtt_status = "🔴 Disconnected"
-        st.metric("MQTT Status", mqtt_status)
+        st.metric("MQTT Status", STATUS_LABELS[mqtt_ok])
     
     with col3:
         st.metric("Device", config.get('device', {}).get('name', 'Unknown'))
@@ -225,7 +312,21 @@ def main():
     # Read sensor data
     if sensor:
         try:
-            data = sensor.read_all_sensors()
+            seq, data = sensor.read_sample()
+            n_value = data.get('nitrogen')
+            p_value = data.get('phosphorus')
+            k_value = data.get('potassium')
+            
+            # Session history: one point per successful read, failed reads
+            # would show up as fake zeros in the chart and statistics. Reruns
+            # (widgets, buttons) see the same polled sample again, skip it.
+            if n_value is not None and p_value is not None and k_value is not None:
+                if seq != st.session_state.get('history_seq'):
+                    st.session_state['history'].append((datetime.now(), n_value, p_value, k_value))
+                    st.session_state['history_seq'] = seq
+            else:
+                st.warning("No valid NPK reading from the sensor")
+            history_df = pd.DataFrame(list(st.session_state['history']), columns=HISTORY_COLUMNS).astype(HISTORY_DTYPES)
             
             # Current readings
             st.subheader("📊 Current Readings")
@@ -233,19 +334,19 @@ def main():
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                n_value = data.get('nitrogen', 0) or 0
-                fig_n = create_gauge_chart(n_value, "Nitrogen (N)", color='#1f77b4')
+                fig_n = create_gauge_chart(n_value or 0, "Nitrogen (N)", color='#1f77b4')
                 st.plotly_chart(fig_n, use_container_width=True)
+                show_session_stats(history_df['nitrogen'])
             
             with col2:
-                p_value = data.get('phosphorus', 0) or 0
-                fig_p = create_gauge_chart(p_value, "Phosphorus (P)", color='#ff7f0e')
+                fig_p = create_gauge_chart(p_value or 0, "Phosphorus (P)", color='#ff7f0e')
                 st.plotly_chart(fig_p, use_container_width=True)
+                show_session_stats(history_df['phosphorus'])
             
             with col3:
-                k_value = data.get('potassium', 0) or 0
-                fig_k = create_gauge_chart(k_value, "Potassium (K)", color='#2ca02c')
+                fig_k = create_gauge_chart(k_value or 0, "Potassium (K)", color='#2ca02c')
                 st.plotly_chart(fig_k, use_container_width=True)
+                show_session_stats(history_df['potassium'])
             
             # Additional sensors
             if any(key in data for key in ['temperature', 'moisture', 'ph', 'ec']):
@@ -273,27 +374,25 @@ def main():
                 st.json(data)
             
             # Publish button
-            if publisher and publisher.is_connected():
+            if publisher:
                 if st.button("📤 Publish to ThingsBoard", type="primary"):
                     with st.spinner("Publishing..."):
-                        if publisher.publish_telemetry(data):
+                        # Connect lazily, only when the user actually publishes
+                        connected = publisher.is_connected()
+                        if not connected:
+                            connected = publisher.connect()
+                            _mqtt_status_cached.clear()
+                        
+                        # With QoS > 0 paho queues the message while offline,
+                        # so a successful publish is not a delivery then
+                        if not publisher.publish_telemetry(data):
+                            st.error("Failed to publish data")
+                        elif connected:
                             st.success("Data published successfully!")
                         else:
-                            st.error("Failed to publish data")
-            
-            # Simulated history (in production, use a database)
-            st.subheader("📈 Historical Data (Last 24 Hours)")
-            st.info("Note: This is simulated data. In production, implement data logging to display actual history.")
+                            st.warning("MQTT broker unreachable, data queued but not sent")
             
-            # Generate sample data
-            now = datetime.now()
-            timestamps = [now - timedelta(hours=i) for i in range(24, 0, -1)]
-            history_df = pd.DataFrame({
-                'timestamp': timestamps,
-                'nitrogen': [n_value + (i % 10) for i in range(24)],
-                'phosphorus': [p_value + (i % 8) for i in range(24)],
-                'potassium': [k_value + (i % 12) for i in range(24)]
-            })
+            st.subheader("📈 Historical Data (This Session)")
             
             fig_history = create_history_chart(history_df)
             st.plotly_chart(fig_history, use_container_width=True)
@@ -302,11 +401,6 @@ def main():
             st.error(f"Error reading sensor: {e}")
     else:
         st.error("Sensor not initialized. Check configuration and connection.")
-    
-    # Auto-refresh
-    if auto_refresh:
-        time.sleep(refresh_interval)
-        st.rerun()
 
 if __name__ == '__main__':
     main()
@@ -214,7 +214,7 @@ step_install_python_packages() {
         print_success "Python packages installed"
     else
         print_warning "requirements.txt not found, installing packages manually..."
-        pip3 install pyserial minimalmodbus paho-mqtt PyYAML --break-system-packages --quiet
+        pip3 install pyserial minimalmodbus paho-mqtt PyYAML orjson --break-system-packages --quiet
         print_success "Core Python packages installed"
     fi
 }
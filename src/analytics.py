@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Analytics Module
+Numeric helpers for summarising NPK sensor history
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit
+except ImportError:
+    logger.debug("numba not installed, analytics will run in pure Python")
+
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit when numba is not installed"""
+        def decorator(func):
+            return func
+        return decorator
+
+
+@njit(cache=True, fastmath=True)
+def rolling_stats(arr):
+    """
+    Compute summary statistics over a window of readings
+
+    Args:
+        arr: 1-D float32 array of readings
+
+    Returns:
+        Tuple of (mean, min, max, std), NaN for an empty window
+    """
+    n = arr.shape[0]
+    if n == 0:
+        return np.nan, np.nan, np.nan, np.nan
+
+    total = 0.0
+    low = float(arr[0])
+    high = float(arr[0])
+    for i in range(n):
+        value = float(arr[i])
+        total += value
+        if value < low:
+            low = value
+        if value > high:
+            high = value
+    mean = total / n
+
+    variance = 0.0
+    for i in range(n):
+        diff = float(arr[i]) - mean
+        variance += diff * diff
+
+    return mean, low, high, np.sqrt(variance / n)
+
+
+@njit(cache=True)
+def lttb_indices(x, y, n_out):
+    """
+    Select points to plot using Largest-Triangle-Three-Buckets downsampling
+
+    Args:
+        x: 1-D float64 array of x values (e.g. timestamps as integers), ascending
+        y: 1-D array of y values, same length as x
+        n_out: Number of points to keep
+
+    Returns:
+        int64 array of selected indices, always including the first and last point
+    """
+    n = x.shape[0]
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[n_out - 1] = n - 1
+
+    bucket_size = (n - 2) / (n_out - 2)
+    anchor = 0
+    for i in range(n_out - 2):
+        # Average of the next bucket is the third vertex of the triangle
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        avg_x = 0.0
+        avg_y = 0.0
+        for j in range(next_start, next_end):
+            avg_x += x[j]
+            avg_y += y[j]
+        avg_x /= next_end - next_start
+        avg_y /= next_end - next_start
+
+        # Keep the point in this bucket forming the largest triangle
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        anchor_x = x[anchor]
+        anchor_y = y[anchor]
+        max_area = -1.0
+        chosen = start
+        for j in range(start, end):
+            area = abs((anchor_x - avg_x) * (y[j] - anchor_y) - (anchor_x - x[j]) * (avg_y - anchor_y))
+            if area > max_area:
+                max_area = area
+                chosen = j
+
+        selected[i + 1] = chosen
+        anchor = chosen
+
+    return selected
+
+
+# Compile once at import so the first dashboard render doesn't pay the JIT cost
+rolling_stats(np.zeros(1, dtype=np.float32))
+lttb_indices(np.zeros(1, dtype=np.float64), np.zeros(1, dtype=np.float32), 1)
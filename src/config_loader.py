@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Configuration Loader Module
+Loads the YAML configuration, caching the parsed result in a JSON sidecar file
+"""
+
+import os
+import stat
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import yaml
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Prefer the libyaml-backed loader when PyYAML was built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def _parse_yaml(path: Path) -> Dict:
+    """Parse a YAML file"""
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=YAML_LOADER)
+
+
+def _source_key(yaml_stat: os.stat_result) -> Dict:
+    """Identify the YAML file contents a sidecar was built from"""
+    return {'mtime_ns': yaml_stat.st_mtime_ns, 'size': yaml_stat.st_size}
+
+
+def _read_sidecar(sidecar: Path, yaml_stat: os.stat_result) -> Optional[Dict]:
+    """Load the JSON cache if it was built from the current YAML file"""
+    try:
+        cached = orjson.loads(sidecar.read_bytes())
+    except (OSError, ValueError):
+        return None
+
+    if isinstance(cached, dict) and cached.get('source') == _source_key(yaml_stat):
+        return cached.get('config')
+    return None
+
+
+def _write_sidecar(sidecar: Path, config: Dict, yaml_stat: os.stat_result):
+    """Write the JSON cache with the same permissions as the YAML file"""
+    data = orjson.dumps({'source': _source_key(yaml_stat), 'config': config})
+    # YAML dates or non-string keys would load back as different types
+    if orjson.loads(data)['config'] != config:
+        raise TypeError("configuration is not JSON-safe")
+
+    fd = os.open(sidecar, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(sidecar, stat.S_IMODE(yaml_stat.st_mode))
+
+
+def load_config_fast(path: Union[str, Path]) -> Dict:
+    """
+    Load a YAML configuration file, reusing its JSON sidecar when up to date
+
+    The parsed configuration is cached next to the YAML file as
+    '<name>.json' (e.g. config.yaml.json) together with the modification
+    time (ns) and size of the YAML file. The sidecar is loaded with orjson
+    only while both still match exactly. Without orjson, when the
+    configuration does not survive a JSON round trip unchanged (e.g. YAML
+    dates), or when the sidecar cannot be written, the YAML file is simply
+    parsed.
+
+    Args:
+        path: Path to the YAML configuration file
+
+    Returns:
+        Configuration dictionary
+    """
+    path = Path(path)
+    if orjson is None:
+        return _parse_yaml(path)
+
+    sidecar = path.with_name(path.name + '.json')
+    yaml_stat = path.stat()
+    config = _read_sidecar(sidecar, yaml_stat)
+    if config is not None:
+        return config
+
+    config = _parse_yaml(path)
+    try:
+        _write_sidecar(sidecar, config, yaml_stat)
+    except (OSError, TypeError) as e:
+        logger.debug("Could not write configuration cache %s: %s", sidecar, e)
+    return config
@@ -4,15 +4,16 @@ NPK Sensor to ThingsBoard - Main Application
 Reads NPK sensor data via RS485 and publishes to ThingsBoard via MQTT
 """
 
-import yaml
 import time
 import signal
 import sys
 import logging
+import logging.handlers
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Optional
 
+from config_loader import load_config_fast
 from npk_reader import NPKSensorReader
 from mqtt_publisher import ThingsBoardMQTTPublisher
 
@@ -55,18 +56,18 @@ class NPKMonitor:
             if not config_file.exists():
                 raise FileNotFoundError(f"Configuration file not found: {self.config_path}")
             
-            with open(config_file, 'r') as f:
-                config = yaml.safe_load(f)
+            # load_config_fast reuses the parsed JSON sidecar while the file is unchanged
+            config = load_config_fast(config_file)
             
-            logger.info(f"Loaded configuration from {self.config_path}")
+            logger.info("Loaded configuration from %s", self.config_path)
             return config
         except Exception as e:
-            logger.error(f"Failed to load configuration: {e}")
+            logger.error("Failed to load configuration: %s", e)
             raise
     
     def _signal_handler(self, signum, frame):
         """Handle shutdown signals"""
-        logger.info(f"Received signal {signum}, initiating graceful shutdown...")
+        logger.info("Received signal %s, initiating graceful shutdown...", signum)
         self.stop()
     
     def _initialize_sensor(self) -> bool:
@@ -92,7 +93,7 @@ class NPKMonitor:
                 return False
                 
         except Exception as e:
-            logger.error(f"Failed to initialize sensor: {e}")
+            logger.error("Failed to initialize sensor: %s", e)
             return False
     
     def _initialize_publisher(self) -> bool:
@@ -106,7 +107,16 @@ class NPKMonitor:
                 port=mqtt_config.get('port', 1883),
                 access_token=tb_config['access_token'],
                 keepalive=mqtt_config.get('keepalive', 60),
-                qos=mqtt_config.get('qos', 1)
+                qos=mqtt_config.get('qos', 1),
+                max_batch=mqtt_config.get('batch_size', 1),
+                max_delay_ms=int(mqtt_config.get('batch_window', 300) * 1000),
+                max_queued=mqtt_config.get('max_queued', 10000),
+                clean_session=not mqtt_config.get('persistent_session', False),
+                protocol=mqtt_config.get('protocol', '3.1.1'),
+                message_expiry=mqtt_config.get('message_expiry'),
+                delta=mqtt_config.get('delta_publish', False),
+                max_suppress_ms=int(mqtt_config.get('delta_max_suppress', 300) * 1000),
+                keyframe_interval=mqtt_config.get('delta_keyframe_interval', 10)
             )
             
             # Connect to broker
@@ -122,7 +132,7 @@ class NPKMonitor:
                 return False
                 
         except Exception as e:
-            logger.error(f"Failed to initialize publisher: {e}")
+            logger.error("Failed to initialize publisher: %s", e)
             return False
     
     def _publish_device_attributes(self):
@@ -139,12 +149,15 @@ class NPKMonitor:
             self.publisher.publish_attributes(attributes)
             logger.info("Published device attributes")
         except Exception as e:
-            logger.error(f"Error publishing device attributes: {e}")
+            logger.error("Error publishing device attributes: %s", e)
     
     def _read_sensor_data(self) -> Optional[Dict]:
         """Read all available sensor data"""
         try:
             data = self.sensor.read_all_sensors()
+            if self.sensor.last_transaction_count > len(self.sensor.read_plan):
+                logger.debug("Sensor read used %d Modbus transactions (planned %d)",
+                             self.sensor.last_transaction_count, len(self.sensor.read_plan))
             
             # Validate data - ensure at least NPK values are present
             if data.get('nitrogen') is None and data.get('phosphorus') is None and data.get('potassium') is None:
@@ -152,14 +165,15 @@ class NPKMonitor:
                 self.stats['sensor_errors'] += 1
                 return None
             
-            # Remove None values
+            # Remove None values. Each key keeps one type: the reader returns
+            # int for registers without decimals and float for scaled ones.
             data = {k: v for k, v in data.items() if v is not None}
             
             self.stats['readings_count'] += 1
             return data
             
         except Exception as e:
-            logger.error(f"Error reading sensor data: {e}")
+            logger.error("Error reading sensor data: %s", e)
             self.stats['sensor_errors'] += 1
             return None
     
@@ -168,7 +182,7 @@ class NPKMonitor:
         try:
             # Add timestamp
             use_timestamp = self.config.get('mqtt', {}).get('include_timestamp', False)
-            timestamp = int(datetime.now().timestamp() * 1000) if use_timestamp else None
+            timestamp = time.time_ns() // 1_000_000 if use_timestamp else None
             
             if self.publisher.publish_telemetry(data, timestamp):
                 self.stats['publish_success'] += 1
@@ -178,18 +192,24 @@ class NPKMonitor:
                 return False
                 
         except Exception as e:
-            logger.error(f"Error publishing data: {e}")
+            logger.error("Error publishing data: %s", e)
             self.stats['publish_failed'] += 1
             return False
     
     def _ensure_mqtt_connection(self):
         """Ensure MQTT connection is active, reconnect if needed"""
-        if not self.publisher.is_connected():
+        if self.publisher.is_connected():
+            return
+        
+        if self.publisher.is_reconnecting():
+            # paho's network thread retries with backoff, don't block the sensor loop
+            logger.debug("MQTT connection down, waiting for automatic reconnect...")
+        else:
             logger.warning("MQTT connection lost, attempting to reconnect...")
             try:
                 self.publisher.connect()
             except Exception as e:
-                logger.error(f"Reconnection failed: {e}")
+                logger.error("Reconnection failed: %s", e)
     
     def start(self):
         """Start the monitoring application"""
@@ -211,10 +231,13 @@ class NPKMonitor:
         self.running = True
         self.stats['start_time'] = datetime.now()
         
-        logger.info(f"NPK Monitor started (reading interval: {reading_interval}s)")
+        logger.info("NPK Monitor started (reading interval: %ss)", reading_interval)
         logger.info("Press Ctrl+C to stop")
         
         try:
+            # Deadline-based schedule so read/publish latency doesn't stretch the period
+            next_tick = time.monotonic()
+            
             while self.running:
                 # Ensure MQTT connection
                 self._ensure_mqtt_connection()
@@ -224,7 +247,7 @@ class NPKMonitor:
                 data = self._read_sensor_data()
                 
                 if data:
-                    logger.info(f"Sensor data: {data}")
+                    logger.info("Sensor data: %s", data)
                     
                     # Publish to ThingsBoard
                     if self._publish_data(data):
@@ -235,11 +258,17 @@ class NPKMonitor:
                     logger.warning("No valid sensor data to publish")
                 
                 # Wait for next reading
-                logger.debug(f"Waiting {reading_interval} seconds until next reading...")
-                time.sleep(reading_interval)
+                next_tick += reading_interval
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    logger.debug("Waiting %.1f seconds until next reading...", sleep_for)
+                    time.sleep(sleep_for)
+                else:
+                    logger.warning("Reading cycle overran the interval by %.1f seconds", -sleep_for)
+                    next_tick = time.monotonic()
                 
         except Exception as e:
-            logger.error(f"Error in main loop: {e}")
+            logger.error("Error in main loop: %s", e)
             return False
         finally:
             self.stop()
@@ -272,15 +301,15 @@ class NPKMonitor:
             uptime = datetime.now() - self.stats['start_time']
             
             logger.info("=== Statistics ===")
-            logger.info(f"Uptime: {uptime}")
-            logger.info(f"Total readings: {self.stats['readings_count']}")
-            logger.info(f"Successful publishes: {self.stats['publish_success']}")
-            logger.info(f"Failed publishes: {self.stats['publish_failed']}")
-            logger.info(f"Sensor errors: {self.stats['sensor_errors']}")
+            logger.info("Uptime: %s", uptime)
+            logger.info("Total readings: %d", self.stats['readings_count'])
+            logger.info("Successful publishes: %d", self.stats['publish_success'])
+            logger.info("Failed publishes: %d", self.stats['publish_failed'])
+            logger.info("Sensor errors: %d", self.stats['sensor_errors'])
             
             if self.stats['readings_count'] > 0:
                 success_rate = (self.stats['publish_success'] / self.stats['readings_count']) * 100
-                logger.info(f"Success rate: {success_rate:.1f}%")
+                logger.info("Success rate: %.1f%%", success_rate)
 
 
 def main():
@@ -303,7 +332,10 @@ def main():
         format=log_format,
         handlers=[
             logging.StreamHandler(sys.stdout),
-            logging.FileHandler('/var/log/npk-monitor.log') if Path('/var/log').exists() else logging.NullHandler()
+            # delay=True: the file is only opened on the first emitted record
+            logging.handlers.RotatingFileHandler('/var/log/npk-monitor.log', maxBytes=10_000_000,
+                                                 backupCount=3, delay=True)
+            if Path('/var/log').exists() else logging.NullHandler()
         ]
     )
     
@@ -327,7 +359,7 @@ def main():
         logger.info("\nInterrupted by user")
         return 0
     except Exception as e:
-        logger.error(f"Fatal error: {e}", exc_info=True)
+        logger.error("Fatal error: %s", e, exc_info=True)
         return 1
 
 
@@ -5,14 +5,62 @@ Publishes sensor telemetry data to ThingsBoard platform
 """
 
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 import json
 import time
+import hashlib
 import logging
-from typing import Dict, Optional, Callable
+import threading
+from array import array
+from collections import deque
+from typing import Deque, Dict, List, Optional, Callable, Tuple
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# ThingsBoard device API topics
+TELEMETRY_TOPIC = "v1/devices/me/telemetry"
+ATTRIBUTES_TOPIC = "v1/devices/me/attributes"
+
+# Number of distinct attribute payloads kept encoded
+ATTRIBUTES_CACHE_SIZE = 8
+
+# Max telemetry samples per PUBLISH (~8 KB of JSON for a full NPK reading,
+# well below the broker payload limits of ThingsBoard)
+MAX_SAMPLES_PER_MESSAGE = 64
+
+# Max telemetry samples buffered for batching, including those kept for
+# another flush after the client refused them (oldest are dropped first)
+MAX_BUFFERED_SAMPLES = 10000
+
+# Supported MQTT protocol versions by configuration name
+MQTT_PROTOCOLS = {
+    '3.1.1': mqtt.MQTTv311,
+    '5': mqtt.MQTTv5,
+}
+
+# Broker-side lifetime of a persistent MQTT v5 session after disconnecting (seconds)
+SESSION_EXPIRY_INTERVAL = 7 * 24 * 3600
+
+# Slots of the publisher's counter array
+PUBLISH_COUNT = 0     # acknowledged messages
+ERROR_COUNT = 1       # messages the client did not accept
+LAST_PUBLISH_NS = 2   # time.time_ns() of the last acknowledgement
+ACK_LATENCY_NS = 3    # total send-to-acknowledgement time
+
+
+def _dumps(obj) -> bytes:
+    """Serialize a payload to JSON bytes (orjson if available)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
 
 class ThingsBoardMQTTPublisher:
     """
@@ -30,7 +78,17 @@ class ThingsBoardMQTTPublisher:
                  access_token: str = None,
                  client_id: str = None,
                  keepalive: int = 60,
-                 qos: int = 1):
+                 qos: int = 1,
+                 max_batch: int = 1,
+                 max_delay_ms: int = 300000,
+                 max_inflight: int = 20,
+                 max_queued: int = 10000,
+                 clean_session: bool = True,
+                 protocol: str = '3.1.1',
+                 message_expiry: Optional[int] = None,
+                 delta: bool = False,
+                 max_suppress_ms: int = 300000,
+                 keyframe_interval: int = 10):
         """
         Initialize ThingsBoard MQTT Publisher
         
@@ -38,21 +96,95 @@ class ThingsBoardMQTTPublisher:
             host: MQTT broker hostname (e.g., 'demo.thingsboard.io')
             port: MQTT broker port (default: 1883)
             access_token: ThingsBoard device access token
-            client_id: MQTT client ID (default: auto-generated)
+            client_id: MQTT client ID (default: auto-generated, derived from
+                       the access token for persistent sessions)
             keepalive: Keep-alive interval in seconds
             qos: Quality of Service level (0, 1, or 2)
+            max_batch: Telemetry samples per message (1 = publish immediately)
+            max_delay_ms: Max age of a buffered sample before the batch is sent
+            max_inflight: Max messages sent to the broker and awaiting acknowledgement
+            max_queued: Max messages held by the client and not yet acknowledged,
+                        sent or queued (also while disconnected); 0 = max_inflight
+            clean_session: Start a new broker session on every connect. With
+                           False the broker resumes the session under a fixed
+                           client ID; messages queued in this client are kept
+                           in memory only and do not survive a restart.
+            protocol: MQTT protocol version, '3.1.1' or '5'
+            message_expiry: Seconds after which the broker may discard an
+                            undelivered message (MQTT 5 only, None = never)
+            delta: Publish only telemetry values that changed since the last sample
+            max_suppress_ms: With delta, max time without any telemetry message;
+                             a full sample is sent after it
+            keyframe_interval: With delta, every Nth message carries all values
         """
         self.host = host
         self.port = port
         self.access_token = access_token
-        self.client_id = client_id or f"npk_sensor_{int(time.time())}"
+        if client_id is None:
+            if not clean_session and access_token:
+                # A persistent session is only resumed under the same client ID
+                client_id = f"npk_sensor_{hashlib.sha1(access_token.encode()).hexdigest()[:12]}"
+            else:
+                client_id = f"npk_sensor_{int(time.time())}"
+        self.client_id = client_id
+        self.clean_session = clean_session
         self.keepalive = keepalive
         self.qos = qos
+        self.protocol = MQTT_PROTOCOLS[str(protocol)]
+        
+        # MQTT 5 publish properties: common ones and per-topic alias variants.
+        # Aliases only live as long as a connection and are granted by the
+        # broker in CONNACK (topic -> [alias, properties, announced]).
+        self._publish_properties = None
+        if self.protocol == mqtt.MQTTv5 and message_expiry:
+            self._publish_properties = Properties(PacketTypes.PUBLISH)
+            self._publish_properties.MessageExpiryInterval = message_expiry
+        self.message_expiry = message_expiry
+        self._topic_alias_maximum = 0
+        self._topic_aliases: Dict[str, list] = {}
         
         self.connected = False
         self.client = None
-        self.last_publish_time = None
-        self.publish_count = 0
+        self._loop_running = False
+        
+        # Set by _on_connect once the broker answered a connection attempt,
+        # cleared again on disconnect
+        self._connect_event = threading.Event()
+        self._connect_rc = None
+        self._counters = array('Q', [0, 0, 0, 0])
+        
+        # Publish confirmations: send time (time.monotonic_ns) of each
+        # unacknowledged message by mid. paho's 16-bit mids wrap around, so
+        # they are only unique among outstanding messages.
+        # Acks arriving before the mid is recorded are parked in _early_acks.
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self._inflight: Dict[int, int] = {}
+        self._early_acks = set()
+        self._inflight_cond = threading.Condition()
+        
+        # Bound on unacknowledged messages, whether paho sent them (at most
+        # max_inflight, enforced by paho) or still queues them
+        self._max_pending = max(max_inflight, max_queued)
+        self._pending_slots = threading.BoundedSemaphore(self._max_pending)
+        
+        # Telemetry batching
+        self.max_batch = max_batch
+        self.max_delay_ms = max_delay_ms
+        self._batch: Deque[Tuple[int, Dict]] = deque()
+        
+        # Delta publishing: last published values and when/how a full
+        # sample (keyframe) was last sent
+        self.delta = delta
+        self.max_suppress_ms = max_suppress_ms
+        self.keyframe_interval = keyframe_interval
+        self._last_sample: Dict = {}
+        self._last_sent_ms = 0
+        self._since_keyframe = keyframe_interval  # first sample is a keyframe
+        
+        # Encoded attribute payloads keyed by their sorted (key, type, value)
+        # items, oldest first
+        self._attr_cache: Dict[tuple, bytes] = {}
         
         # Callbacks
         self.on_connect_callback: Optional[Callable] = None
@@ -65,7 +197,11 @@ class ThingsBoardMQTTPublisher:
         """Initialize MQTT client"""
         try:
             # Create MQTT client instance
-            self.client = mqtt.Client(client_id=self.client_id)
+            if self.protocol == mqtt.MQTTv5:
+                # MQTT 5 replaces clean_session with clean_start on connect
+                self.client = mqtt.Client(client_id=self.client_id, protocol=self.protocol)
+            else:
+                self.client = mqtt.Client(client_id=self.client_id, clean_session=self.clean_session)
             
             # Set access token as username (ThingsBoard requirement)
             if self.access_token:
@@ -79,16 +215,31 @@ class ThingsBoardMQTTPublisher:
             # Enable automatic reconnection
             self.client.reconnect_delay_set(min_delay=1, max_delay=120)
             
-            logger.info(f"Initialized MQTT client (ID: {self.client_id})")
+            # Bound once, every message goes through it
+            self._client_publish = self.client.publish
+            
+            # Send up to max_inflight QoS>0 messages at once; paho queues the
+            # rest (and everything published while disconnected) until acked
+            self.client.max_inflight_messages_set(self.max_inflight)
+            self.client.max_queued_messages_set(self.max_queued)
+            
+            logger.info("Initialized MQTT client (ID: %s)", self.client_id)
         except Exception as e:
-            logger.error(f"Failed to initialize MQTT client: {e}")
+            logger.error("Failed to initialize MQTT client: %s", e)
             raise
     
-    def _on_connect(self, client, userdata, flags, rc):
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
         """Callback for when client connects to broker"""
+        # MQTT 5 passes a ReasonCodes object
+        reason = rc
+        rc = getattr(rc, 'value', rc)
+        self._connect_rc = rc
         if rc == 0:
+            self._topic_aliases = {}
+            self._topic_alias_maximum = getattr(properties, 'TopicAliasMaximum', 0)
             self.connected = True
-            logger.info(f"Connected to ThingsBoard MQTT broker at {self.host}:{self.port}")
+            logger.info("Connected to ThingsBoard MQTT broker at %s:%s", self.host, self.port)
+            
             if self.on_connect_callback:
                 self.on_connect_callback()
         else:
@@ -100,26 +251,187 @@ class ThingsBoardMQTTPublisher:
                 4: "Bad username or password",
                 5: "Not authorized"
             }
-            error_msg = error_messages.get(rc, f"Unknown error (code: {rc})")
-            logger.error(f"Connection failed: {error_msg}")
+            if self.protocol == mqtt.MQTTv5:
+                error_msg = f"{reason} (code: {rc})"
+            else:
+                error_msg = error_messages.get(rc, f"Unknown error (code: {rc})")
+            logger.error("Connection failed: %s", error_msg)
+        
+        # Wake up connect() whether the broker accepted or refused
+        self._connect_event.set()
     
-    def _on_disconnect(self, client, userdata, rc):
+    def _on_disconnect(self, client, userdata, rc, properties=None):
         """Callback for when client disconnects from broker"""
         self.connected = False
+        self._connect_event.clear()
+        # Topic aliases only live as long as the connection
+        self._topic_aliases = {}
+        self._topic_alias_maximum = 0
         if rc == 0:
             logger.info("Disconnected from MQTT broker (clean)")
         else:
-            logger.warning(f"Unexpected disconnection from MQTT broker (code: {rc})")
+            logger.warning("Unexpected disconnection from MQTT broker (code: %s)", rc)
         
         if self.on_disconnect_callback:
             self.on_disconnect_callback(rc)
     
     def _on_publish(self, client, userdata, mid):
         """Callback for when message is published"""
-        logger.debug(f"Message published (mid: {mid})")
+        logger.debug("Message published (mid: %s)", mid)
+        # QoS 0 messages are settled in _publish already
+        if self.qos > 0:
+            with self._inflight_cond:
+                sent_ns = self._inflight.pop(mid, None)
+                if sent_ns is not None:
+                    self._acknowledge(sent_ns)
+                else:
+                    # Acknowledged before _publish recorded the mid
+                    self._early_acks.add(mid)
+        
         if self.on_publish_callback:
             self.on_publish_callback(mid)
     
+    def _acknowledge(self, sent_ns: int):
+        """Account for a broker acknowledgement (caller holds _inflight_cond)"""
+        self._pending_slots.release()
+        counters = self._counters
+        counters[PUBLISH_COUNT] += 1
+        counters[LAST_PUBLISH_NS] = time.time_ns()
+        counters[ACK_LATENCY_NS] += time.monotonic_ns() - sent_ns
+        if not self._inflight:
+            self._inflight_cond.notify_all()
+    
+    def _publish(self, topic: str, payload: bytes) -> bool:
+        """
+        Hand a message to paho without waiting for its acknowledgement
+        
+        All publish methods end up here. A QoS>0 message counts against the
+        pending limit until _on_publish confirms it. QoS 0 has no
+        acknowledgement and paho drops its queued packets on reconnect
+        without calling on_publish, so those count as sent once paho takes
+        them. paho invokes on_publish while holding its own message lock, so
+        _inflight_cond must not be held across client.publish().
+        
+        While disconnected, paho keeps QoS>0 messages and sends them once the
+        connection is back; QoS 0 messages are dropped.
+        
+        Args:
+            topic: MQTT topic
+            payload: Encoded message payload
+            
+        Returns:
+            True if the message was accepted by the client, False otherwise
+        """
+        if not self._pending_slots.acquire(blocking=False):
+            self._counters[ERROR_COUNT] += 1
+            logger.error("Too many pending messages (%d awaiting acknowledgement)", self._max_pending)
+            return False
+        
+        alias = None
+        properties = self._publish_properties
+        if self._topic_alias_maximum and self.qos == 0:
+            # QoS>0 messages may be resent on a later connection where the
+            # alias is unknown, so only QoS 0 uses topic aliases
+            alias = self._topic_alias(topic)
+            if alias is not None:
+                properties = alias[1]
+                if alias[2]:
+                    topic = ''
+        
+        sent_ns = time.monotonic_ns()
+        try:
+            result = self._client_publish(topic, payload, self.qos, False, properties)
+        except (ValueError, OSError) as e:
+            # paho rejects invalid topics and oversized payloads with ValueError
+            self._pending_slots.release()
+            self._counters[ERROR_COUNT] += 1
+            logger.error("Error publishing to %s: %s", topic, e)
+            return False
+        except BaseException:
+            # Anything else is a bug, let it propagate
+            self._pending_slots.release()
+            raise
+        
+        if alias is not None and result.rc == mqtt.MQTT_ERR_SUCCESS:
+            # The broker now maps the alias to the topic
+            alias[2] = True
+        
+        if result.rc == mqtt.MQTT_ERR_NO_CONN and self.qos > 0:
+            logger.debug("Not connected, message %d queued until reconnect", result.mid)
+        elif result.rc != mqtt.MQTT_ERR_SUCCESS:
+            self._pending_slots.release()
+            self._counters[ERROR_COUNT] += 1
+            logger.error("Publish failed (rc: %s)", result.rc)
+            return False
+        
+        with self._inflight_cond:
+            if self.qos == 0:
+                self._acknowledge(sent_ns)
+            elif result.mid in self._early_acks:
+                self._early_acks.discard(result.mid)
+                self._acknowledge(sent_ns)
+            else:
+                self._inflight[result.mid] = sent_ns
+        return True
+    
+    def _topic_alias(self, topic: str) -> Optional[list]:
+        """
+        Get the topic alias entry for a topic, assigning one if available
+        
+        Args:
+            topic: MQTT topic
+            
+        Returns:
+            [alias, properties, announced] or None when the broker allows no more aliases
+        """
+        entry = self._topic_aliases.get(topic)
+        if entry is None:
+            alias = len(self._topic_aliases) + 1
+            if alias > self._topic_alias_maximum:
+                return None
+            properties = Properties(PacketTypes.PUBLISH)
+            properties.TopicAlias = alias
+            if self.message_expiry:
+                properties.MessageExpiryInterval = self.message_expiry
+            entry = self._topic_aliases[topic] = [alias, properties, False]
+        return entry
+    
+    @property
+    def publish_count(self) -> int:
+        """Number of messages acknowledged by the broker"""
+        return self._counters[PUBLISH_COUNT]
+    
+    @property
+    def error_count(self) -> int:
+        """Number of messages that could not be handed to the client"""
+        return self._counters[ERROR_COUNT]
+    
+    @property
+    def last_publish_ns(self) -> Optional[int]:
+        """time.time_ns() of the last acknowledged message, None before the first"""
+        return self._counters[LAST_PUBLISH_NS] or None
+    
+    def pending_count(self) -> int:
+        """Number of published messages not yet acknowledged by the broker"""
+        return len(self._inflight)
+    
+    def queued_count(self) -> int:
+        """Number of QoS>0 messages held by paho (queued or awaiting acknowledgement)"""
+        return len(self.client._out_messages) if self.client else 0
+    
+    def drain(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until all published messages are acknowledged
+        
+        Args:
+            timeout: Maximum time to wait in seconds
+            
+        Returns:
+            True if nothing is left in flight, False on timeout
+        """
+        with self._inflight_cond:
+            return self._inflight_cond.wait_for(lambda: not self._inflight, timeout)
+    
     def connect(self, timeout: int = 10) -> bool:
         """
         Connect to MQTT broker
@@ -131,82 +443,225 @@ class ThingsBoardMQTTPublisher:
             True if connected successfully, False otherwise
         """
         try:
-            logger.info(f"Connecting to {self.host}:{self.port}...")
-            self.client.connect(self.host, self.port, self.keepalive)
-            self.client.loop_start()
+            if not self._loop_running:
+                logger.info("Connecting to %s:%s...", self.host, self.port)
+                self._connect_event.clear()
+                if self.protocol == mqtt.MQTTv5:
+                    properties = None
+                    if not self.clean_session:
+                        properties = Properties(PacketTypes.CONNECT)
+                        properties.SessionExpiryInterval = SESSION_EXPIRY_INTERVAL
+                    self.client.connect(self.host, self.port, self.keepalive,
+                                        clean_start=self.clean_session, properties=properties)
+                else:
+                    self.client.connect(self.host, self.port, self.keepalive)
+                self.client.loop_start()
+                self._loop_running = True
+            # Otherwise the network thread is already reconnecting in the background
             
-            # Wait for connection
-            start_time = time.time()
-            while not self.connected and (time.time() - start_time) < timeout:
-                time.sleep(0.1)
+            # Wait for the broker's answer
+            answered = self._connect_event.wait(timeout)
             
             if self.connected:
                 logger.info("Connection established")
                 return True
+            elif answered:
+                logger.error("Connection refused by broker (code: %s)", self._connect_rc)
+                return False
             else:
-                logger.error(f"Connection timeout after {timeout} seconds")
+                logger.error("Connection timeout after %s seconds", timeout)
                 return False
                 
         except Exception as e:
-            logger.error(f"Connection error: {e}")
+            logger.error("Connection error: %s", e)
             return False
     
     def disconnect(self):
         """Disconnect from MQTT broker"""
         try:
+            # Send whatever is still waiting in the batch and let it be acknowledged.
+            # While disconnected paho still queues QoS>0 messages, so flush anyway.
+            if self._batch:
+                self.flush()
+                if self._batch:
+                    logger.warning("Could not send %d buffered samples at disconnect", len(self._batch))
+            if self.connected:
+                if not self.drain():
+                    logger.warning("%d messages still unacknowledged at disconnect", self.pending_count())
+            elif self.pending_count():
+                logger.warning("Broker unreachable, %d messages dropped at disconnect", self.pending_count())
+            
             if self.client:
                 self.client.loop_stop()
+                self._loop_running = False
                 self.client.disconnect()
                 logger.info("Disconnected from MQTT broker")
         except Exception as e:
-            logger.error(f"Error during disconnect: {e}")
+            logger.error("Error during disconnect: %s", e)
     
     def publish_telemetry(self, data: Dict, timestamp: Optional[int] = None) -> bool:
         """
         Publish telemetry data to ThingsBoard
         
+        With batching enabled (max_batch > 1) the sample is buffered and the
+        batch is sent once it holds max_batch samples or its oldest sample
+        is older than max_delay_ms.
+        
+        With delta publishing only changed values are sent and an unchanged
+        sample is not sent at all, except for periodic full samples
+        (every keyframe_interval messages or after max_suppress_ms).
+        
         Args:
             data: Dictionary of telemetry key-value pairs
             timestamp: Unix timestamp in milliseconds (optional)
             
         Returns:
-            True if published successfully, False otherwise
+            True if published, buffered or suppressed successfully, False otherwise
         """
-        if not self.connected:
-            logger.error("Cannot publish: not connected to MQTT broker")
+        if not self.delta:
+            return self._send_telemetry(data, timestamp)
+        
+        now_ms = time.monotonic_ns() // 1_000_000
+        if (self._since_keyframe >= self.keyframe_interval or
+                now_ms - self._last_sent_ms >= self.max_suppress_ms):
+            values = data
+            keyframe = True
+        else:
+            last = self._last_sample
+            values = {k: v for k, v in data.items() if k not in last or last[k] != v}
+            keyframe = False
+            if not values:
+                logger.debug("Telemetry unchanged, not published")
+                return True
+        
+        if not self._send_telemetry(values, timestamp):
             return False
         
+        # The values reached the client or sit in the batch buffer, which
+        # keeps refused samples for the next flush. A sample that is dropped
+        # instead forces a keyframe (see _drop_samples).
+        self._last_sample.update(values)
+        self._last_sent_ms = now_ms
+        self._since_keyframe = 1 if keyframe else self._since_keyframe + 1
+        return True
+    
+    def _send_telemetry(self, data: Dict, timestamp: Optional[int]) -> bool:
+        """Buffer or publish one telemetry sample (see publish_telemetry)"""
+        if self.max_batch > 1:
+            # Batched samples always carry their own timestamp
+            timestamp = timestamp or time.time_ns() // 1_000_000
+            if len(self._batch) >= MAX_BUFFERED_SAMPLES:
+                self._batch.popleft()
+                self._drop_samples()
+                logger.warning("Telemetry buffer full, oldest sample dropped")
+            self._batch.append((timestamp, data))
+            
+            if (len(self._batch) >= self.max_batch or
+                    timestamp - self._batch[0][0] >= self.max_delay_ms):
+                return self.flush()
+            
+            logger.debug("Buffered telemetry sample (%d/%d)", len(self._batch), self.max_batch)
+            return True
+        
+        # Without timestamp ThingsBoard uses the server time
+        payload = {"ts": timestamp, "values": data} if timestamp else data
         try:
-            # Prepare payload
-            if timestamp:
-                # With timestamp
-                payload = {
-                    "ts": timestamp,
-                    "values": data
-                }
-            else:
-                # Without timestamp (ThingsBoard will use server time)
-                payload = data
+            json_payload = _dumps(payload)
+        except (TypeError, ValueError) as e:
+            logger.error("Error encoding telemetry: %s", e)
+            return False
+        
+        if not self.publish_raw(TELEMETRY_TOPIC, json_payload):
+            return False
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Published telemetry: %s", json_payload.decode())
+        return True
+    
+    def publish_telemetry_batch(self, samples: List[Tuple[int, Dict]]) -> bool:
+        """
+        Publish several timestamped telemetry samples
+        
+        Samples are sent MAX_SAMPLES_PER_MESSAGE per message, so a long
+        backlog does not become a single payload the broker may reject.
+        
+        Args:
+            samples: List of (timestamp_ms, values) tuples
             
-            # Convert to JSON
-            json_payload = json.dumps(payload)
+        Returns:
+            True if all samples were published successfully, False otherwise
+        """
+        unsent, dropped = self._publish_samples(samples)
+        return not unsent and not dropped
+    
+    def _publish_samples(self, samples: List[Tuple[int, Dict]]) -> Tuple[List[Tuple[int, Dict]], int]:
+        """
+        Publish samples MAX_SAMPLES_PER_MESSAGE per message
+        
+        Args:
+            samples: List of (timestamp_ms, values) tuples
             
-            # Publish to ThingsBoard telemetry topic
-            topic = "v1/devices/me/telemetry"
-            result = self.client.publish(topic, json_payload, qos=self.qos)
+        Returns:
+            Tuple of (samples of the messages the client refused, in order;
+            number of samples dropped because they could not be encoded)
+        """
+        unsent = []
+        dropped = 0
+        for i in range(0, len(samples), MAX_SAMPLES_PER_MESSAGE):
+            chunk = samples[i:i + MAX_SAMPLES_PER_MESSAGE]
+            try:
+                payload = _dumps([{"ts": ts, "values": values} for ts, values in chunk])
+            except (TypeError, ValueError) as e:
+                # Sending these again would fail the same way
+                logger.error("Error encoding telemetry batch, %d samples dropped: %s", len(chunk), e)
+                self._drop_samples()
+                dropped += len(chunk)
+                continue
             
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                self.last_publish_time = datetime.now()
-                self.publish_count += 1
-                logger.info(f"Published telemetry: {json_payload}")
-                return True
+            if self.publish_raw(TELEMETRY_TOPIC, payload):
+                logger.debug("Published telemetry batch (%d samples)", len(chunk))
             else:
-                logger.error(f"Publish failed (rc: {result.rc})")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Error publishing telemetry: {e}")
+                unsent.extend(chunk)
+        return unsent, dropped
+    
+    def _drop_samples(self):
+        """Account for buffered samples that will never be published"""
+        # With delta publishing the consumer missed values it was assumed to
+        # know, so the next sample carries all of them
+        self._since_keyframe = self.keyframe_interval
+    
+    def flush(self) -> bool:
+        """
+        Publish all buffered telemetry samples
+        
+        Samples of messages the client refused stay buffered, ahead of newer
+        samples, and are sent again by the next flush.
+        
+        Returns:
+            True if the buffer was empty or published successfully
+        """
+        samples = list(self._batch)
+        self._batch.clear()
+        unsent, dropped = self._publish_samples(samples)
+        if unsent:
+            self._batch.extendleft(reversed(unsent))
+            logger.debug("%d telemetry samples kept for the next flush", len(unsent))
+        return not unsent and not dropped
+    
+    def publish_raw(self, topic: str, payload: bytes) -> bool:
+        """
+        Publish an already serialized payload
+        
+        Args:
+            topic: MQTT topic (e.g. TELEMETRY_TOPIC)
+            payload: Encoded JSON payload
+            
+        Returns:
+            True if published successfully, False otherwise
+        """
+        if not self._publish(topic, payload):
             return False
+        logger.debug("Published %d bytes to %s", len(payload), topic)
+        return True
     
     def publish_attributes(self, data: Dict) -> bool:
         """
@@ -218,33 +673,39 @@ class ThingsBoardMQTTPublisher:
         Returns:
             True if published successfully, False otherwise
         """
-        if not self.connected:
-            logger.error("Cannot publish: not connected to MQTT broker")
-            return False
-        
+        # Attributes rarely change, reuse the encoded payload when possible
         try:
-            # Convert to JSON
-            json_payload = json.dumps(data)
-            
-            # Publish to ThingsBoard attributes topic
-            topic = "v1/devices/me/attributes"
-            result = self.client.publish(topic, json_payload, qos=self.qos)
-            
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                logger.info(f"Published attributes: {json_payload}")
-                return True
-            else:
-                logger.error(f"Publish failed (rc: {result.rc})")
+            # 1, 1.0 and True compare equal but encode differently
+            key = tuple(sorted((k, type(v).__name__, v) for k, v in data.items()))
+            json_payload = self._attr_cache.get(key)
+        except TypeError:
+            # Unhashable or mixed-type values are not cached
+            key = json_payload = None
+        
+        if json_payload is None:
+            try:
+                json_payload = _dumps(data)
+            except (TypeError, ValueError) as e:
+                logger.error("Error encoding attributes: %s", e)
                 return False
-                
-        except Exception as e:
-            logger.error(f"Error publishing attributes: {e}")
+            if key is not None:
+                if len(self._attr_cache) >= ATTRIBUTES_CACHE_SIZE:
+                    del self._attr_cache[next(iter(self._attr_cache))]
+                self._attr_cache[key] = json_payload
+        
+        if not self._publish(ATTRIBUTES_TOPIC, json_payload):
             return False
+        logger.info("Published attributes: %s", json_payload.decode())
+        return True
     
     def is_connected(self) -> bool:
         """Check if client is connected"""
         return self.connected
     
+    def is_reconnecting(self) -> bool:
+        """Check if the network thread is retrying a lost connection"""
+        return self._loop_running and not self.connected
+    
     def get_statistics(self) -> Dict:
         """Get publisher statistics"""
         return {
@@ -253,7 +714,13 @@ class ThingsBoardMQTTPublisher:
             'port': self.port,
             'client_id': self.client_id,
             'publish_count': self.publish_count,
-            'last_publish_time': self.last_publish_time.isoformat() if self.last_publish_time else None
+            'error_count': self.error_count,
+            'pending_count': self.pending_count(),
+            'queued_count': self.queued_count(),
+            'avg_ack_latency_ms': (self._counters[ACK_LATENCY_NS] / self.publish_count / 1e6
+                                   if self.publish_count else None),
+            'last_publish_time': (datetime.fromtimestamp(self.last_publish_ns / 1e9).isoformat()
+                                  if self.last_publish_ns else None)
         }
 
 
@@ -331,6 +798,7 @@ def main():
         print(f"Broker: {stats['host']}:{stats['port']}")
         print(f"Client ID: {stats['client_id']}")
         print(f"Publish Count: {stats['publish_count']}")
+        print(f"Pending: {stats['pending_count']}")
         print(f"Last Publish: {stats['last_publish_time']}")
         print()
         
@@ -341,7 +809,7 @@ def main():
         return 0
         
     except Exception as e:
-        logger.error(f"Error: {e}")
+        logger.error("Error: %s", e)
         return 1
 
 
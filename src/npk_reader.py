@@ -7,12 +7,47 @@ Reads Nitrogen, Phosphorus, and Potassium values from NPK sensor via RS485/Modbu
 import minimalmodbus
 import serial
 import time
+import struct
+import functools
 import logging
-from typing import Dict, Optional, Tuple
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
 
+def _build_crc16_table() -> array:
+    """Lookup table for the Modbus CRC-16 (reflected polynomial 0xA001)"""
+    table = array('H')
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC16_TABLE = _build_crc16_table()
+
+
+def _crc16(data: bytes) -> int:
+    """
+    Compute the Modbus CRC-16 of a frame
+    
+    Args:
+        data: Frame bytes
+        
+    Returns:
+        CRC value (0 for a complete frame including its own CRC)
+    """
+    crc = 0xFFFF
+    table = _CRC16_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
 class NPKSensorReader:
     """
     NPK Sensor Reader using Modbus RTU protocol over RS485
@@ -37,12 +72,38 @@ class NPKSensorReader:
         'ec': 0x0015,          # Electrical Conductivity (μS/cm) - optional
     }
     
+    # Decimal places of each register value
+    REGISTER_DECIMALS = {
+        'nitrogen': 0,
+        'phosphorus': 0,
+        'potassium': 0,
+        'temperature': 1,
+        'moisture': 1,
+        'ph': 1,
+        'ec': 0,
+    }
+    
+    # Registers holding two's complement values (e.g. sub-zero soil temperature)
+    SIGNED_REGISTERS = frozenset({'temperature'})
+    
+    # Maximum number of registers in one Modbus read request
+    MAX_REGISTERS_PER_READ = 125
+    
+    # Modbus function code for Read Holding Registers
+    READ_HOLDING_REGISTERS = 3
+    
+    # Largest hole of unused registers read through rather than starting a
+    # new transaction. An extra RTU transaction costs ~20 byte times (request
+    # frame, response header/CRC, inter-frame silences), a skipped register 2.
+    MAX_REGISTER_GAP = 10
+    
     def __init__(self, 
                  port: str = '/dev/ttyS0',
                  slave_id: int = 1,
                  baudrate: int = 4800,
                  timeout: float = 1.0,
-                 registers: Optional[Dict[str, int]] = None):
+                 registers: Optional[Dict[str, int]] = None,
+                 ttl: float = 0):
         """
         Initialize NPK Sensor Reader
         
@@ -52,6 +113,8 @@ class NPKSensorReader:
             baudrate: Communication baud rate
             timeout: Serial communication timeout in seconds
             registers: Custom register addresses (optional)
+            ttl: Seconds a register value read from the bus is reused by
+                 the read_* methods (0 disables caching)
         """
         self.port = port
         self.slave_id = slave_id
@@ -62,6 +125,33 @@ class NPKSensorReader:
         self.instrument = None
         self._initialize_instrument()
         
+        # Number of Modbus transactions used by the last read_all_sensors() call
+        self.last_transaction_count = 0
+        self._transactions = 0
+        self._build_read_plan()
+        
+        # Register address -> (monotonic read time, raw register value)
+        self.ttl = ttl
+        self._cache: Dict[int, Tuple[float, int]] = {}
+        
+        # Request frames by (start, count) and the RTU inter-frame silence
+        # (3.5 character times, at least 1.75 ms above 19200 baud)
+        self._frames: Dict[Tuple[int, int], bytes] = {}
+        self._silent_period = max(3.5 * 11 / baudrate, 0.00175)
+        self._last_frame_time = 0.0
+        
+        # Background polling (start_polling): the serial bus is shared between
+        # the poll thread and direct read_* calls
+        self._bus_lock = threading.RLock()
+        # Latest polled sample as (sequence number, readings); every read
+        # from the sensor gets the next sequence number
+        self._latest: Optional[Tuple[int, Dict[str, Optional[float]]]] = None
+        self._latest_lock = threading.Lock()
+        self._sample_seq = 0
+        self._poll_thread: Optional[threading.Thread] = None
+        self._poll_stop = threading.Event()
+        self.poll_interval = None
+        
     def _initialize_instrument(self):
         """Initialize Modbus RTU instrument"""
         try:
@@ -74,15 +164,174 @@ class NPKSensorReader:
             self.instrument.mode = minimalmodbus.MODE_RTU
             self.instrument.clear_buffers_before_each_transaction = True
             
-            logger.info(f"Initialized NPK sensor on {self.port} (Slave ID: {self.slave_id}, Baudrate: {self.baudrate})")
+            logger.info("Initialized NPK sensor on %s (Slave ID: %s, Baudrate: %s)",
+                        self.port, self.slave_id, self.baudrate)
         except Exception as e:
-            logger.error(f"Failed to initialize sensor: {e}")
+            logger.error("Failed to initialize sensor: %s", e)
+            raise
+    
+    def _build_read_plan(self):
+        """Group the configured registers into as few block reads as practical"""
+        runs = []  # [start, count]
+        for address in sorted(set(self.registers.values())):
+            if runs:
+                start, count = runs[-1]
+                gap = address - (start + count)
+                if gap <= self.MAX_REGISTER_GAP and address - start < self.MAX_REGISTERS_PER_READ:
+                    runs[-1][1] = address - start + 1
+                    continue
+            runs.append([address, 1])
+        
+        # Read plan: (start address, register count) per block read
+        self.read_plan: List[Tuple[int, int]] = [(start, count) for start, count in runs]
+        self._block_reads = True
+        
+        # Position of each address in the concatenated block registers
+        positions = {}
+        base = 0
+        for start, count in self.read_plan:
+            for address in range(start, start + count):
+                positions[address] = base + address - start
+            base += count
+        
+        # Field name -> (offset in concatenated registers, decimals, signed)
+        self._field_layout = {
+            name: (positions[address], self.REGISTER_DECIMALS.get(name, 0),
+                   name in self.SIGNED_REGISTERS)
+            for name, address in self.registers.items()
+        }
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Register read plan: %s",
+                         ", ".join(f"0x{start:04X}+{count}" for start, count in self.read_plan))
+        
+        self._decode = self._compile_decoder()
+        
+        # Single-register readers per field with address and decoding bound
+        self._readers = {
+            name: functools.partial(self._read_register, address,
+                                    self.REGISTER_DECIMALS.get(name, 0),
+                                    name in self.SIGNED_REGISTERS)
+            for name, address in self.registers.items()
+        }
+    
+    def _compile_decoder(self):
+        """
+        Generate a decoder specialized for the register layout
+        
+        The layout is fixed after construction, so the field offsets, sign
+        extension and scaling are emitted as constants in a single dict
+        display, e.g.
+        {'nitrogen': regs[24], 'temperature': ((regs[12] ^ 32768) - 32768) / 10, ...}
+        
+        Returns:
+            Function mapping a list of block registers to a reading dict
+        """
+        fields = []
+        for name, (offset, decimals, signed) in self._field_layout.items():
+            expr = f"regs[{offset}]"
+            if signed:
+                expr = f"(({expr} ^ 32768) - 32768)"
+            if decimals:
+                expr = f"{expr} / {10 ** decimals}"
+            fields.append(f"{name!r}: {expr}")
+        
+        source = "def _decode(regs):\n    return {" + ", ".join(fields) + "}\n"
+        namespace = {}
+        exec(source, namespace)
+        return namespace['_decode']
+    
+    def _read_holding_registers(self, start: int, count: int) -> List[int]:
+        """
+        Run one Read Holding Registers transaction on the serial port
+        
+        The RTU frames are built and checked here with struct and a table
+        CRC; minimalmodbus only provides the configured serial port.
+        
+        Args:
+            start: First register address
+            count: Number of registers
+            
+        Returns:
+            Raw (unsigned) register values
+            
+        Raises:
+            minimalmodbus.IllegalRequestError: If the sensor rejects the request
+            minimalmodbus.ModbusException: On a missing, corrupt or unexpected response
+        """
+        request = self._frames.get((start, count))
+        if request is None:
+            request = struct.pack('>BBHH', self.slave_id, self.READ_HOLDING_REGISTERS, start, count)
+            request += struct.pack('<H', _crc16(request))
+            self._frames[(start, count)] = request
+        
+        port = self.instrument.serial
+        with self._bus_lock:
+            silence = self._last_frame_time + self._silent_period - time.monotonic()
+            if silence > 0:
+                time.sleep(silence)
+            
+            port.reset_input_buffer()
+            port.write(request)
+            try:
+                # Slave address, function code, byte count (or exception code)
+                header = port.read(3)
+                if len(header) < 3:
+                    raise minimalmodbus.NoResponseError("No response from sensor")
+                
+                slave, function, length = header
+                if function == self.READ_HOLDING_REGISTERS | 0x80:
+                    response = header + port.read(2)
+                    if _crc16(response) != 0:
+                        raise minimalmodbus.InvalidResponseError("CRC mismatch in exception response")
+                    if length in (1, 2, 3):
+                        raise minimalmodbus.IllegalRequestError(
+                            f"Sensor reported illegal request (exception code {length})")
+                    raise minimalmodbus.SlaveReportedException(f"Sensor reported exception code {length}")
+                
+                if slave != self.slave_id or function != self.READ_HOLDING_REGISTERS or length != 2 * count:
+                    raise minimalmodbus.InvalidResponseError(f"Unexpected response header {header.hex()}")
+                
+                body = port.read(length + 2)
+                if len(body) < length + 2:
+                    raise minimalmodbus.NoResponseError("Incomplete response from sensor")
+                if _crc16(header + body) != 0:
+                    raise minimalmodbus.InvalidResponseError("CRC mismatch in response")
+            finally:
+                self._last_frame_time = time.monotonic()
+        
+        return list(struct.unpack_from(f'>{count}H', body))
+    
+    def _read_block(self, start: int, count: int) -> Optional[List[int]]:
+        """
+        Read a block of consecutive registers in a single Modbus transaction
+        
+        Args:
+            start: First register address
+            count: Number of registers
+            
+        Returns:
+            Raw register values or None on error
+            
+        Raises:
+            minimalmodbus.IllegalRequestError: If the sensor rejects the block
+        """
+        self._transactions += 1
+        try:
+            return self._read_holding_registers(start, count)
+        except minimalmodbus.IllegalRequestError:
             raise
+        except Exception as e:
+            logger.error("Error reading registers 0x%04X-0x%04X: %s", start, start + count - 1, e)
+            return None
     
     def _read_register(self, register_address: int, decimals: int = 0, signed: bool = False) -> Optional[float]:
         """
         Read a single Modbus register
         
+        A value read from the bus less than ttl seconds ago, either by this
+        method or by a block read, is returned without a Modbus transaction.
+        
         Args:
             register_address: Modbus register address
             decimals: Number of decimal places
@@ -91,72 +340,85 @@ class NPKSensorReader:
         Returns:
             Register value or None on error
         """
-        try:
-            value = self.instrument.read_register(
-                register_address, 
-                number_of_decimals=decimals,
-                functioncode=3,  # Read Holding Registers
-                signed=signed
-            )
-            return value
-        except Exception as e:
-            logger.error(f"Error reading register 0x{register_address:04X}: {e}")
-            return None
+        cached = self._cache.get(register_address)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            raw = cached[1]
+        else:
+            self._transactions += 1
+            try:
+                raw = self._read_holding_registers(register_address, 1)[0]
+            except Exception as e:
+                logger.error("Error reading register 0x%04X: %s", register_address, e)
+                return None
+            if self.ttl > 0:
+                self._cache[register_address] = (time.monotonic(), raw)
+        
+        if signed and raw >= 0x8000:
+            raw -= 0x10000
+        return raw / 10 ** decimals if decimals else raw
+    
+    def invalidate(self):
+        """Drop all cached register values so the next reads go to the bus"""
+        self._cache.clear()
     
     def read_nitrogen(self) -> Optional[float]:
         """Read nitrogen content (mg/kg or ppm)"""
-        value = self._read_register(self.registers['nitrogen'], decimals=0)
+        value = self._readers['nitrogen']()
         if value is not None:
-            logger.debug(f"Nitrogen: {value} mg/kg")
+            logger.debug("Nitrogen: %s mg/kg", value)
         return value
     
     def read_phosphorus(self) -> Optional[float]:
         """Read phosphorus content (mg/kg or ppm)"""
-        value = self._read_register(self.registers['phosphorus'], decimals=0)
+        value = self._readers['phosphorus']()
         if value is not None:
-            logger.debug(f"Phosphorus: {value} mg/kg")
+            logger.debug("Phosphorus: %s mg/kg", value)
         return value
     
     def read_potassium(self) -> Optional[float]:
         """Read potassium content (mg/kg or ppm)"""
-        value = self._read_register(self.registers['potassium'], decimals=0)
+        value = self._readers['potassium']()
         if value is not None:
-            logger.debug(f"Potassium: {value} mg/kg")
+            logger.debug("Potassium: %s mg/kg", value)
         return value
     
     def read_temperature(self) -> Optional[float]:
         """Read soil temperature (°C) if available"""
-        if 'temperature' in self.registers:
-            value = self._read_register(self.registers['temperature'], decimals=1)
+        reader = self._readers.get('temperature')
+        if reader is not None:
+            value = reader()
             if value is not None:
-                logger.debug(f"Temperature: {value} °C")
+                logger.debug("Temperature: %s °C", value)
             return value
         return None
     
     def read_moisture(self) -> Optional[float]:
         """Read soil moisture (%) if available"""
-        if 'moisture' in self.registers:
-            value = self._read_register(self.registers['moisture'], decimals=1)
+        reader = self._readers.get('moisture')
+        if reader is not None:
+            value = reader()
             if value is not None:
-                logger.debug(f"Moisture: {value} %")
+                logger.debug("Moisture: %s %%", value)
             return value
         return None
     
     def read_ph(self) -> Optional[float]:
         """Read soil pH if available"""
-        if 'ph' in self.registers:
-            value = self._read_register(self.registers['ph'], decimals=1)
+        reader = self._readers.get('ph')
+        if reader is not None:
+            value = reader()
             if value is not None:
-                logger.debug(f"pH: {value}")
+                logger.debug("pH: %s", value)
             return value
         return None
     
     def read_ec(self) -> Optional[float]:
         """Read electrical conductivity (μS/cm) if available"""
-        if 'ec' in self.registers:
-            value = self._read_register(self.registers['ec'], decimals=0)
+        reader = self._readers.get('ec')
+        if reader is not None:
+            value = reader()
             if value is not None:
-                logger.debug(f"EC: {value} μS/cm")
+                logger.debug("EC: %s μS/cm", value)
             return value
         return None
     
@@ -177,9 +439,125 @@ class NPKSensorReader:
         """
         Read all available sensor values including NPK and optional parameters
         
+        Registers are fetched with the block reads of read_plan (two for the
+        default register map). If the sensor rejects a block (e.g. unmapped
+        addresses inside a hole), the reader falls back to one read per
+        register from then on.
+        
+        While background polling is active (start_polling) this returns a
+        copy of the latest polled sample without touching the bus.
+        
         Returns:
             Dictionary with all sensor readings
         """
+        return self.read_sample()[1]
+    
+    def read_sample(self) -> Tuple[int, Dict[str, Optional[float]]]:
+        """
+        Read all sensor values like read_all_sensors, with a sequence number
+        
+        The sequence number increases with every read from the sensor, so
+        callers can tell a new polled sample from one they have already seen.
+        
+        Returns:
+            Tuple of (sequence number, dictionary with all sensor readings)
+        """
+        if self._poll_thread is not None:
+            with self._latest_lock:
+                if self._latest is not None:
+                    seq, data = self._latest
+                    return seq, dict(data)
+        
+        return self._read_all_from_bus()
+    
+    def _read_all_from_bus(self) -> Tuple[int, Dict[str, Optional[float]]]:
+        """Read all sensor values from the sensor and number the sample"""
+        with self._bus_lock:
+            self._transactions = 0
+            try:
+                data = None
+                if self._block_reads:
+                    try:
+                        data = self._read_all_blocks()
+                    except minimalmodbus.IllegalRequestError as e:
+                        logger.warning("Sensor rejected block read (%s), using per-register reads", e)
+                        self._block_reads = False
+                
+                if data is None:
+                    data = self._read_all_individually()
+            finally:
+                self.last_transaction_count = self._transactions
+            
+            self._sample_seq += 1
+            return self._sample_seq, data
+    
+    def start_polling(self, interval: float):
+        """
+        Read the sensor periodically in a background thread
+        
+        read_all_sensors() then returns the latest sample immediately. Only
+        the most recent sample is kept. Calling this again while polling
+        just changes the interval.
+        
+        Args:
+            interval: Seconds between two reads
+        """
+        self.poll_interval = interval
+        if self._poll_thread is not None and self._poll_thread.is_alive():
+            return
+        
+        self._poll_stop.clear()
+        self._poll_thread = threading.Thread(target=self._poll_loop, name='npk-poll', daemon=True)
+        self._poll_thread.start()
+        logger.info("Started background sensor polling (interval: %ss)", interval)
+    
+    def stop_polling(self, timeout: float = 5.0):
+        """
+        Stop background polling
+        
+        Args:
+            timeout: Maximum time to wait for a read in progress
+        """
+        if self._poll_thread is None:
+            return
+        
+        self._poll_stop.set()
+        self._poll_thread.join(timeout)
+        self._poll_thread = None
+        with self._latest_lock:
+            self._latest = None
+    
+    def _poll_loop(self):
+        """Background thread body: read the sensor until stop_polling()"""
+        next_tick = time.monotonic()
+        while not self._poll_stop.is_set():
+            try:
+                sample = self._read_all_from_bus()
+                with self._latest_lock:
+                    self._latest = sample
+            except Exception as e:
+                logger.error("Error polling sensor: %s", e)
+            
+            next_tick = max(next_tick + self.poll_interval, time.monotonic())
+            self._poll_stop.wait(next_tick - time.monotonic())
+    
+    def _read_all_blocks(self) -> Dict[str, Optional[float]]:
+        """Read all sensor values with the planned block reads and decode each field"""
+        registers = []
+        for start, count in self.read_plan:
+            block = self._read_block(start, count)
+            if block is None:
+                return {'nitrogen': None, 'phosphorus': None, 'potassium': None}
+            registers.extend(block)
+            
+            if self.ttl > 0:
+                now = time.monotonic()
+                self._cache.update((start + i, (now, raw)) for i, raw in enumerate(block))
+        
+        return self._decode(registers)
+    
+    def _read_all_individually(self) -> Dict[str, Optional[float]]:
+        """Read all sensor values with one Modbus transaction per register"""
         data = self.read_npk()
         
         # Add optional sensors if configured
@@ -211,23 +589,24 @@ class NPKSensorReader:
         try:
             value = self.read_nitrogen()
             if value is not None:
-                logger.info(f"Connection test successful! Read nitrogen value: {value} mg/kg")
+                logger.info("Connection test successful! Read nitrogen value: %s mg/kg", value)
                 return True
             else:
                 logger.warning("Connection test failed: could not read nitrogen value")
                 return False
         except Exception as e:
-            logger.error(f"Connection test failed: {e}")
+            logger.error("Connection test failed: %s", e)
             return False
     
     def close(self):
         """Close serial connection"""
+        self.stop_polling()
         if self.instrument and self.instrument.serial:
             try:
                 self.instrument.serial.close()
                 logger.info("Serial connection closed")
             except Exception as e:
-                logger.error(f"Error closing serial connection: {e}")
+                logger.error("Error closing serial connection: %s", e)
 
 
 def main():
@@ -308,7 +687,7 @@ def main():
             print()
         
     except Exception as e:
-        logger.error(f"Error: {e}")
+        logger.error("Error: %s", e)
         return 1
     finally:
         sensor.close()